@@ -2,10 +2,10 @@ from __future__ import annotations
 
 from decimal import Decimal
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from sqlalchemy import text
 
-from app.db.session import get_engine
+from app.cache import PRODUCTS_NAMESPACE, SALES_NAMESPACE, cache_get, cache_set, invalidate
 from app.schemas import (
     ErrorResponse,
     Product,
@@ -21,26 +21,38 @@ from app.schemas import (
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
-def _to_float(v):
-    if v is None:
-        return 0.0
-    if isinstance(v, float):
-        return v
-    if isinstance(v, int):
-        return float(v)
-    if isinstance(v, Decimal):
-        return float(v)
-    return float(v)
+# revenue is NUMERIC; asyncpg would store a float's full binary expansion (0.1 -> 0.1000000000000000055...),
+# so bind the float's shortest decimal form instead.
+def _revenue(value: float) -> Decimal:
+    return Decimal(str(value))
+
+
+# Upper bound on rows per batch insert; keeps the statement well under Postgres' bind-parameter limit.
+_MAX_BATCH_SIZE = 1000
+
+
+def _check_batch_size(payload: list) -> None:
+    if not payload:
+        raise HTTPException(status_code=400, detail={"error": "validation", "detail": "No rows to insert"})
+    if len(payload) > _MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail={"error": "validation", "detail": f"At most {_MAX_BATCH_SIZE} rows per batch"},
+        )
 
 
 # --- Products Management ---
 
 
 @router.get("/products", response_model=ProductList)
-def list_products():
-    engine = get_engine()
-    with engine.connect() as conn:
-        rows = conn.execute(
+async def list_products(request: Request):
+    cached, generation = await cache_get(PRODUCTS_NAMESPACE, "list")
+    if cached is not None:
+        return cached
+
+    engine = request.app.state.engine
+    async with engine.connect() as conn:
+        result = await conn.execute(
             text(
                 """
                 SELECT id, name, category
@@ -48,17 +60,21 @@ def list_products():
                 ORDER BY id ASC
                 """
             )
-        ).mappings().all()
+        )
+        rows = result.mappings().all()
 
-    return {"items": [Product(**r) for r in rows]}
+    # Rows are cached as plain dicts, as in list_sales; response_model validates them once on the way out.
+    data = {"items": [dict(r) for r in rows]}
+    await cache_set(PRODUCTS_NAMESPACE, "list", data, generation)
+    return data
 
 
 @router.post("/products", response_model=Product, responses={400: {"model": ErrorResponse}})
-def create_product(payload: ProductCreate):
-    engine = get_engine()
+async def create_product(request: Request, payload: ProductCreate):
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            result = await conn.execute(
                 text(
                     """
                     INSERT INTO products (name, category)
@@ -67,20 +83,56 @@ def create_product(payload: ProductCreate):
                     """
                 ),
                 {"name": payload.name, "category": payload.category},
-            ).mappings().first()
+            )
+            row = result.mappings().first()
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
     if not row:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": "Insert failed"})
 
+    # Sales list rows embed product name/category, so product changes invalidate both.
+    await invalidate(PRODUCTS_NAMESPACE, SALES_NAMESPACE)
     return Product(**row)
 
 
+# Insert many products with one multi-row INSERT.
+@router.post("/products:batch", response_model=ProductList, responses={400: {"model": ErrorResponse}})
+async def create_products_batch(request: Request, payload: list[ProductCreate]):
+    _check_batch_size(payload)
+
+    values_sql = ", ".join(f"(:name_{i}, :category_{i})" for i in range(len(payload)))
+    params = {}
+    for i, p in enumerate(payload):
+        params[f"name_{i}"] = p.name
+        params[f"category_{i}"] = p.category
+
+    engine = request.app.state.engine
+    try:
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    f"""
+                    INSERT INTO products (name, category)
+                    VALUES {values_sql}
+                    RETURNING id, name, category
+                    """
+                ),
+                params,
+            )
+            rows = result.mappings().all()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
+
+    await invalidate(PRODUCTS_NAMESPACE, SALES_NAMESPACE)
+    # As in the list endpoints, response_model validates the row dicts once on the way out.
+    return {"items": [dict(r) for r in rows]}
+
+
 @router.patch(
     "/products/{product_id}", response_model=Product, responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}}
 )
-def update_product(product_id: int, payload: ProductUpdate):
+async def update_product(request: Request, product_id: int, payload: ProductUpdate):
     updates = {}
     if payload.name is not None:
         updates["name"] = payload.name
@@ -93,10 +145,10 @@ def update_product(product_id: int, payload: ProductUpdate):
     set_sql = ", ".join([f"{k} = :{k}" for k in updates.keys()])
     params = {**updates, "id": product_id}
 
-    engine = get_engine()
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            result = await conn.execute(
                 text(
                     f"""
                     UPDATE products
@@ -106,24 +158,26 @@ def update_product(product_id: int, payload: ProductUpdate):
                     """
                 ),
                 params,
-            ).mappings().first()
+            )
+            row = result.mappings().first()
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
     if not row:
         raise HTTPException(status_code=404, detail={"error": "not_found", "detail": "Product not found"})
 
+    await invalidate(PRODUCTS_NAMESPACE, SALES_NAMESPACE)
     return Product(**row)
 
 
 @router.delete(
     "/products/{product_id}", response_model=dict, responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}}
 )
-def delete_product(product_id: int):
-    engine = get_engine()
+async def delete_product(request: Request, product_id: int):
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            result = await conn.execute(
                 text(
                     """
                     DELETE FROM products
@@ -132,97 +186,171 @@ def delete_product(product_id: int):
                     """
                 ),
                 {"id": product_id},
-            ).mappings().first()
+            )
+            row = result.mappings().first()
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
     if not row:
         raise HTTPException(status_code=404, detail={"error": "not_found", "detail": "Product not found"})
 
+    await invalidate(PRODUCTS_NAMESPACE, SALES_NAMESPACE)
     return {"ok": True}
 
 
 # --- Sales Management ---
 
 
-@router.get("/sales", response_model=SaleList)
-def list_sales(limit: int = 200, offset: int = 0):
+# Pages can be addressed by offset or, for deep pages, by keyset: pass the (year, id) of the last
+# row already seen as before_year/before_id and the index on (year DESC, id DESC) seeks straight to it.
+@router.get("/sales", response_model=SaleList, responses={400: {"model": ErrorResponse}})
+async def list_sales(
+    request: Request,
+    limit: int = 200,
+    offset: int = 0,
+    before_year: int | None = None,
+    before_id: int | None = None,
+):
     limit = max(1, min(int(limit), 1000))
     offset = max(0, int(offset))
 
-    engine = get_engine()
-    with engine.connect() as conn:
-        rows = conn.execute(
+    params = {"limit": limit, "offset": offset}
+    where_sql = ""
+    if before_year is not None or before_id is not None:
+        if before_year is None or before_id is None:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": "validation", "detail": "before_year and before_id must be given together"},
+            )
+        where_sql = "WHERE (s.year, s.id) < (:before_year, :before_id)"
+        params["before_year"] = before_year
+        params["before_id"] = before_id
+
+    cache_key = f"list:{limit}:{offset}:{before_year}:{before_id}"
+    cached, generation = await cache_get(SALES_NAMESPACE, cache_key)
+    if cached is not None:
+        return cached
+
+    engine = request.app.state.engine
+    async with engine.connect() as conn:
+        result = await conn.execute(
             text(
-                """
+                f"""
                 SELECT s.id,
                        s.product_id,
                        s.year,
-                       s.revenue,
+                       s.revenue::DOUBLE PRECISION AS revenue,
                        p.name AS product_name,
                        p.category AS product_category
                 FROM sales s
                 JOIN products p ON p.id = s.product_id
+                {where_sql}
                 ORDER BY s.year DESC, s.id DESC
                 LIMIT :limit OFFSET :offset
                 """
             ),
-            {"limit": limit, "offset": offset},
-        ).mappings().all()
-
-    items = []
-    for r in rows:
-        r = dict(r)
-        r["revenue"] = _to_float(r.get("revenue"))
-        items.append(Sale(**r))
+            params,
+        )
+        rows = result.mappings().all()
 
-    return {"items": items}
+    # revenue is already cast in SQL, so each row's dict is final: it is what gets cached, and
+    # response_model validates it once on the way out — no Sale objects built here.
+    data = {"items": [dict(r) for r in rows]}
+    await cache_set(SALES_NAMESPACE, cache_key, data, generation)
+    return data
 
 
 @router.post("/sales", response_model=Sale, responses={400: {"model": ErrorResponse}})
-def create_sale(payload: SaleCreate):
-    engine = get_engine()
+async def create_sale(request: Request, payload: SaleCreate):
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            # Join the product in the same statement so the response needs no second round-trip.
+            result = await conn.execute(
                 text(
                     """
-                    INSERT INTO sales (product_id, year, revenue)
-                    VALUES (:product_id, :year, :revenue)
-                    RETURNING id, product_id, year, revenue
+                    WITH ins AS (
+                        INSERT INTO sales (product_id, year, revenue)
+                        VALUES (:product_id, :year, :revenue)
+                        RETURNING id, product_id, year, revenue
+                    )
+                    SELECT ins.id,
+                           ins.product_id,
+                           ins.year,
+                           ins.revenue::DOUBLE PRECISION AS revenue,
+                           p.name AS product_name,
+                           p.category AS product_category
+                    FROM ins
+                    LEFT JOIN products p ON p.id = ins.product_id
                     """
                 ),
-                {"product_id": payload.product_id, "year": payload.year, "revenue": payload.revenue},
-            ).mappings().first()
+                {"product_id": payload.product_id, "year": payload.year, "revenue": _revenue(payload.revenue)},
+            )
+            row = result.mappings().first()
             if not row:
                 raise RuntimeError("Insert failed")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
-            prod = conn.execute(
-                text("""SELECT name, category FROM products WHERE id = :id"""),
-                {"id": row["product_id"]},
-            ).mappings().first()
+    await invalidate(SALES_NAMESPACE)
+    return Sale(**row)
+
+
+# Insert many sales with one multi-row INSERT, joined to products like create_sale.
+@router.post("/sales:batch", response_model=SaleList, responses={400: {"model": ErrorResponse}})
+async def create_sales_batch(request: Request, payload: list[SaleCreate]):
+    _check_batch_size(payload)
+
+    values_sql = ", ".join(f"(:product_id_{i}, :year_{i}, :revenue_{i})" for i in range(len(payload)))
+    params = {}
+    for i, p in enumerate(payload):
+        params[f"product_id_{i}"] = p.product_id
+        params[f"year_{i}"] = p.year
+        params[f"revenue_{i}"] = _revenue(p.revenue)
+
+    engine = request.app.state.engine
+    try:
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    f"""
+                    WITH ins AS (
+                        INSERT INTO sales (product_id, year, revenue)
+                        VALUES {values_sql}
+                        RETURNING id, product_id, year, revenue
+                    )
+                    SELECT ins.id,
+                           ins.product_id,
+                           ins.year,
+                           ins.revenue::DOUBLE PRECISION AS revenue,
+                           p.name AS product_name,
+                           p.category AS product_category
+                    FROM ins
+                    LEFT JOIN products p ON p.id = ins.product_id
+                    ORDER BY ins.id ASC
+                    """
+                ),
+                params,
+            )
+            rows = result.mappings().all()
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
-    data = dict(row)
-    data["revenue"] = _to_float(data.get("revenue"))
-    if prod:
-        data["product_name"] = prod.get("name")
-        data["product_category"] = prod.get("category")
-    return Sale(**data)
+    await invalidate(SALES_NAMESPACE)
+    return {"items": [dict(r) for r in rows]}
 
 
 @router.patch(
     "/sales/{sale_id}", response_model=Sale, responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}}
 )
-def update_sale(sale_id: int, payload: SaleUpdate):
+async def update_sale(request: Request, sale_id: int, payload: SaleUpdate):
     updates = {}
     if payload.product_id is not None:
         updates["product_id"] = payload.product_id
     if payload.year is not None:
         updates["year"] = payload.year
     if payload.revenue is not None:
-        updates["revenue"] = payload.revenue
+        updates["revenue"] = _revenue(payload.revenue)
 
     if not updates:
         raise HTTPException(status_code=400, detail={"error": "validation", "detail": "No fields to update"})
@@ -230,48 +358,50 @@ def update_sale(sale_id: int, payload: SaleUpdate):
     set_sql = ", ".join([f"{k} = :{k}" for k in updates.keys()])
     params = {**updates, "id": sale_id}
 
-    engine = get_engine()
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            result = await conn.execute(
                 text(
                     f"""
-                    UPDATE sales
-                    SET {set_sql}
-                    WHERE id = :id
-                    RETURNING id, product_id, year, revenue
+                    WITH upd AS (
+                        UPDATE sales
+                        SET {set_sql}
+                        WHERE id = :id
+                        RETURNING id, product_id, year, revenue
+                    )
+                    SELECT upd.id,
+                           upd.product_id,
+                           upd.year,
+                           upd.revenue::DOUBLE PRECISION AS revenue,
+                           p.name AS product_name,
+                           p.category AS product_category
+                    FROM upd
+                    LEFT JOIN products p ON p.id = upd.product_id
                     """
                 ),
                 params,
-            ).mappings().first()
+            )
+            row = result.mappings().first()
             if not row:
                 raise KeyError("not_found")
-
-            prod = conn.execute(
-                text("""SELECT name, category FROM products WHERE id = :id"""),
-                {"id": row["product_id"]},
-            ).mappings().first()
     except KeyError:
         raise HTTPException(status_code=404, detail={"error": "not_found", "detail": "Sale not found"})
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
-    data = dict(row)
-    data["revenue"] = _to_float(data.get("revenue"))
-    if prod:
-        data["product_name"] = prod.get("name")
-        data["product_category"] = prod.get("category")
-    return Sale(**data)
+    await invalidate(SALES_NAMESPACE)
+    return Sale(**row)
 
 
 @router.delete(
     "/sales/{sale_id}", response_model=dict, responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}}
 )
-def delete_sale(sale_id: int):
-    engine = get_engine()
+async def delete_sale(request: Request, sale_id: int):
+    engine = request.app.state.engine
     try:
-        with engine.begin() as conn:
-            row = conn.execute(
+        async with engine.begin() as conn:
+            result = await conn.execute(
                 text(
                     """
                     DELETE FROM sales
@@ -280,11 +410,13 @@ def delete_sale(sale_id: int):
                     """
                 ),
                 {"id": sale_id},
-            ).mappings().first()
+            )
+            row = result.mappings().first()
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
     if not row:
         raise HTTPException(status_code=404, detail={"error": "not_found", "detail": "Sale not found"})
 
+    await invalidate(SALES_NAMESPACE)
     return {"ok": True}
@@ -1,14 +1,13 @@
 from __future__ import annotations
 
-from decimal import Decimal
-from typing import Any
+from typing import Any, Callable
 
-from fastapi import APIRouter, HTTPException
+import msgspec
+from fastapi import APIRouter, HTTPException, Request, Response
 
-from app.db.session import get_engine
 from app.mcp.gemini_client import MCPError, parse_intent
 from app.query_planner.planner import QueryPlannerError, as_sqlalchemy_text, plan_intent
-from app.schemas import ErrorResponse, QueryRequest, QueryResponse
+from app.schemas import QUERY_RESPONSE_SCHEMA, Dataset, ErrorResponse, QueryRequest, QueryResponse
 
 router = APIRouter()
 
@@ -65,6 +64,58 @@ def _scope_phrase(filters: dict[str, Any]) -> str:
 
 
 # Generate a chart title based on the intent name and its filters.
+def _top_products_title(intent_payload: dict[str, Any], filters: dict[str, Any], join: Callable[[str], str]) -> str:
+    limit = filters.get("limit")
+    n = limit if isinstance(limit, int) else 10
+    return join(f"Top {n} products by revenue")
+
+
+def _breakdown_title(intent_payload: dict[str, Any], filters: dict[str, Any], join: Callable[[str], str]) -> str:
+    dims = intent_payload.get("dimensions")
+    dim0 = dims[0] if isinstance(dims, list) and dims else "product"
+    return join(f"Sales breakdown by {dim0}")
+
+
+def _multi_year_title(intent_payload: dict[str, Any], filters: dict[str, Any], join: Callable[[str], str]) -> str:
+    if filters.get("average"):
+        return join("Average yearly revenue")
+    return join("Revenue by year")
+
+
+def _top_bottom_title(intent_payload: dict[str, Any], filters: dict[str, Any], join: Callable[[str], str]) -> str:
+    limit = filters.get("limit")
+    n = limit if isinstance(limit, int) else 5
+    entity = filters.get("entity")
+    ent = entity if entity in ("product", "category") else "product"
+    ord_word = "Top" if filters.get("order") != "bottom" else "Bottom"
+    label = "products" if ent == "product" else "categories"
+    return join(f"{ord_word} {n} {label} by revenue")
+
+
+def _fixed_title(base: str) -> Callable[[dict[str, Any], dict[str, Any], Callable[[str], str]], str]:
+    return lambda intent_payload, filters, join: join(base)
+
+
+_TITLE_BUILDERS: dict[str, Callable[[dict[str, Any], dict[str, Any], Callable[[str], str]], str]] = {
+    "sales_trend": _fixed_title("Revenue trend"),
+    "sales_trend_over_time": _fixed_title("Revenue trend"),
+    "sales_comparison": _fixed_title("Revenue comparison"),
+    "sales_comparison_by_year": _fixed_title("Revenue comparison"),
+    "total_sales_for_period": _fixed_title("Total revenue"),
+    "top_products": _top_products_title,
+    "sales_by_product": _fixed_title("Revenue by product"),
+    "revenue_by_category": _fixed_title("Revenue by category"),
+    "sales_by_category": _fixed_title("Revenue by category"),
+    "product_sales_trend": _fixed_title("Product revenue trend"),
+    "sales_breakdown_for_year": _breakdown_title,
+    "sales_growth_analysis": _fixed_title("Year-over-year revenue change"),
+    "multi_year_comparison": _multi_year_title,
+    "top_bottom_performers": _top_bottom_title,
+    "clarification_required": lambda intent_payload, filters, join: "Sales overview (needs clarification)",
+}
+_DEFAULT_TITLE = _fixed_title("Revenue")
+
+
 def _derive_title(intent_payload: dict[str, Any]) -> str:
     intent = str(intent_payload.get("intent") or "")
     filters = intent_payload.get("filters")
@@ -73,10 +124,6 @@ def _derive_title(intent_payload: dict[str, Any]) -> str:
 
     year_part = _year_phrase(filters)
     scope_part = _scope_phrase(filters)
-    limit = filters.get("limit")
-    order = filters.get("order")
-    entity = filters.get("entity")
-    average = bool(filters.get("average"))
 
     def _join(base: str) -> str:
         parts = [base]
@@ -86,64 +133,33 @@ def _derive_title(intent_payload: dict[str, Any]) -> str:
             parts.append(scope_part)
         return " ".join(parts).strip()
 
-    if intent in ("sales_trend", "sales_trend_over_time"):
-        return _join("Revenue trend")
-    if intent in ("sales_comparison", "sales_comparison_by_year"):
-        return _join("Revenue comparison")
-    if intent == "total_sales_for_period":
-        return _join("Total revenue")
-    if intent in ("top_products",):
-        n = limit if isinstance(limit, int) else 10
-        return _join(f"Top {n} products by revenue")
-    if intent in ("sales_by_product",):
-        return _join("Revenue by product")
-    if intent in ("revenue_by_category", "sales_by_category"):
-        return _join("Revenue by category")
-    if intent == "product_sales_trend":
-        return _join("Product revenue trend")
-    if intent == "sales_breakdown_for_year":
-        dims = intent_payload.get("dimensions")
-        dim0 = dims[0] if isinstance(dims, list) and dims else "product"
-        return _join(f"Sales breakdown by {dim0}")
-    if intent == "sales_growth_analysis":
-        return _join("Year-over-year revenue change")
-    if intent == "multi_year_comparison":
-        if average:
-            return _join("Average yearly revenue")
-        return _join("Revenue by year")
-    if intent == "top_bottom_performers":
-        n = limit if isinstance(limit, int) else 5
-        ent = entity if entity in ("product", "category") else "product"
-        ord_word = "Top" if order != "bottom" else "Bottom"
-        label = "products" if ent == "product" else "categories"
-        return _join(f"{ord_word} {n} {label} by revenue")
-    if intent == "clarification_required":
-        return "Sales overview (needs clarification)"
-
-    return _join("Revenue")
-
-
-# Normalize DB values (including Decimal) to float for chart data.
+    return _TITLE_BUILDERS.get(intent, _DEFAULT_TITLE)(intent_payload, filters, _join)
+
+
+# Planned queries already return DOUBLE PRECISION values; only NULL (e.g. the first LAG row) needs mapping.
 def _to_float(v: Any) -> float:
-    if v is None:
-        return 0.0
-    if isinstance(v, float):
-        return v
-    if isinstance(v, int):
-        return float(v)
-    if isinstance(v, Decimal):
-        return float(v)
-    try:
-        return float(v)
-    except Exception:
-        return 0.0
+    return 0.0 if v is None else float(v)
+
 
+_ENCODER = msgspec.json.Encoder()
 
-@router.post("/query", response_model=QueryResponse, responses={400: {"model": ErrorResponse}})
+
+def _json_response(body: QueryResponse) -> Response:
+    return Response(content=_ENCODER.encode(body), media_type="application/json")
+
+
+@router.post(
+    "/query",
+    response_class=Response,
+    responses={
+        200: {"content": {"application/json": {"schema": QUERY_RESPONSE_SCHEMA}}},
+        400: {"model": ErrorResponse},
+    },
+)
 # Parse the user question into an intent, plan deterministic SQL, execute it, and return chart-ready data.
-def query(req: QueryRequest):
+async def query(request: Request, req: QueryRequest):
     try:
-        intent = parse_intent(req.question)
+        intent = await parse_intent(req.question)
     except MCPError as e:
         raise HTTPException(status_code=400, detail={"error": "mcp_error", "detail": str(e)})
 
@@ -152,31 +168,33 @@ def query(req: QueryRequest):
     except QueryPlannerError as e:
         raise HTTPException(status_code=400, detail={"error": "planner_error", "detail": str(e)})
 
-    engine = get_engine()
+    engine = request.app.state.engine
     stmt = as_sqlalchemy_text(plan)
 
     labels: list[str] = []
     values: list[float] = []
 
     try:
-        with engine.connect() as conn:
-            rows = conn.execute(stmt, plan.params).mappings().all()
+        async with engine.connect() as conn:
+            result = await conn.execute(stmt, plan.params)
+            # Pull just the two chart columns as plain tuples; no per-row mapping lookups.
+            for label, value in result.columns(plan.label_field, plan.value_field):
+                labels.append(str(label))
+                values.append(_to_float(value))
     except Exception as e:
         raise HTTPException(status_code=400, detail={"error": "db_error", "detail": str(e)})
 
-    for r in rows:
-        labels.append(str(r.get(plan.label_field)))
-        values.append(_to_float(r.get(plan.value_field)))
-
     title = _derive_title(intent)
 
     if not labels:
         # Return empty chart-ready response to prevent crash on frontend
-        return QueryResponse(title=title, chartType=plan.chart_type, labels=[], datasets=[])
-
-    return QueryResponse(
-        title=title,
-        chartType=plan.chart_type,
-        labels=labels,
-        datasets=[{"label": "total_revenue", "data": values}],
+        return _json_response(QueryResponse(title=title, chartType=plan.chart_type, labels=[], datasets=[]))
+
+    return _json_response(
+        QueryResponse(
+            title=title,
+            chartType=plan.chart_type,
+            labels=labels,
+            datasets=[Dataset(label="total_revenue", data=values)],
+        )
     )
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.coder import JsonCoder
+
+from app.settings import settings
+
+_PREFIX = "anarisuto"
+
+# Namespaces for cached admin list responses; mutations invalidate the namespaces they affect.
+PRODUCTS_NAMESPACE = "products"
+SALES_NAMESPACE = "sales"
+
+# List caching needs a cache shared by all workers: an in-process cache would only be invalidated in the
+# worker that handled the write, so the others would keep serving stale lists. Without Redis it is off.
+_redis = None
+
+
+def init_cache() -> None:
+    global _redis
+    if not settings.redis_url:
+        print("⚠️  REDIS_URL not set; admin list caching is disabled.")
+        return
+    from fastapi_cache.backends.redis import RedisBackend
+    from redis import asyncio as aioredis
+
+    _redis = aioredis.from_url(settings.redis_url)
+    FastAPICache.init(RedisBackend(_redis), prefix=_PREFIX, expire=settings.cache_ttl_seconds)
+
+
+# Each namespace has a generation counter that invalidate() increments, and cached values are keyed under
+# the generation read before the DB query. A list read that races a write therefore stores its result
+# under the old generation, where no later read looks; old generations simply expire.
+def _generation_key(namespace: str) -> str:
+    return f"{FastAPICache.get_prefix()}:{namespace}:generation"
+
+
+def _key(namespace: str, generation: int, key: str) -> str:
+    return f"{FastAPICache.get_prefix()}:{namespace}:{generation}:{key}"
+
+
+# Cache failures must never fail the request; they only cost a trip to Postgres.
+# Returns the cached value (or None) and the generation to hand back to cache_set after a miss.
+async def cache_get(namespace: str, key: str) -> tuple[Any | None, int | None]:
+    if _redis is None:
+        return None, None
+    try:
+        generation = int(await _redis.get(_generation_key(namespace)) or 0)
+        cached = await FastAPICache.get_backend().get(_key(namespace, generation, key))
+    except Exception as e:
+        print(f"⚠️  Cache read failed: {e}")
+        return None, None
+    if cached is None:
+        return None, generation
+    return JsonCoder.decode(cached), generation
+
+
+async def cache_set(namespace: str, key: str, value: Any, generation: int | None) -> None:
+    if _redis is None or generation is None:
+        return
+    try:
+        await FastAPICache.get_backend().set(
+            _key(namespace, generation, key), JsonCoder.encode(value), FastAPICache.get_expire()
+        )
+    except Exception as e:
+        print(f"⚠️  Cache write failed: {e}")
+
+
+async def invalidate(*namespaces: str) -> None:
+    if _redis is None:
+        return
+    for namespace in namespaces:
+        try:
+            await _redis.incr(_generation_key(namespace))
+        except Exception as e:
+            print(f"⚠️  Cache invalidation failed: {e}")
@@ -1,14 +1,25 @@
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from app.settings import settings
 
 
-_engine: Engine | None = None
+_engine: AsyncEngine | None = None
 
 
-def get_engine() -> Engine:
+def get_async_engine() -> AsyncEngine:
     global _engine
     if _engine is None:
-        _engine = create_engine(settings.database_url, pool_pre_ping=True)
+        _engine = create_async_engine(
+            settings.database_url,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_pre_ping=True,
+        )
     return _engine
+
+
+async def dispose_async_engine() -> None:
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import functools
 import json
+import re
+import time
+from collections import OrderedDict
 from typing import Any
 
+import anyio
+
 from app.query_planner.catalog import INTENTS
 from app.settings import settings
 
@@ -18,33 +24,95 @@ Database schema:
 - sales(id, product_id, year, revenue)
 """.strip()
 
-
-def _allowed_guide() -> str:
-    intents = list(INTENTS.keys())
-    return json.dumps(
-        {
-            "intents": intents,
-            "metrics": ["total_revenue"],
-            "dimensions": ["year", "category", "product"],
-            "filters": {
-                "years": "array of integers",
-                "year_from": "integer",
-                "year_to": "integer",
-                "year": "integer",
-                "category": "string",
-                "categories": "array of strings",
-                "product_id": "integer",
-                "product_name": "string",
-                "limit": "integer (1-50)",
-                "order": "string ('top'|'bottom')",
-                "entity": "string ('product'|'category')",
-                "year_count": "integer (1-20)",
-                "average": "boolean",
-            },
-            "charts": ["line", "bar"],
+# Years the stub parser recognises (2015-2030), not embedded in a longer number.
+_YEAR_RE = re.compile(r"(?<!\d)(20(?:1[5-9]|2\d|30))(?!\d)")
+
+_CAT_IN_THE_RE = re.compile(r"\b(?:only\s+)?in\s+the\s+([\w &/\-]+?)\s+category\b", re.IGNORECASE)
+_CAT_IN_RE = re.compile(r"\b(?:only\s+)?in\s+([\w &/\-]+?)\s+category\b", re.IGNORECASE)
+_CAT_KV_RE = re.compile(r"\bcategory\s*[:=]?\s*([\w &/\-]+)\b", re.IGNORECASE)
+
+_RANGE_DASH_RE = re.compile(r"(20\d{2})\s*[-–]\s*(20\d{2})")
+_RANGE_TO_RE = re.compile(r"(20\d{2})\s+(?:to|through|thru)\s+(20\d{2})")
+_BETWEEN_RE = re.compile(r"between\s+(20\d{2})\s+and\s+(20\d{2})")
+_FROM_RE = re.compile(r"from\s+(20\d{2})")
+_TO_RE = re.compile(r"to\s+(20\d{2})")
+
+_LIMIT_RE = re.compile(r"top\s+(\d+)")
+_QUOTED_RE = re.compile(r"\"([^\"]+)\"")
+
+# Keyword buckets for _stub_parse, matched against the lower-cased question.
+# Plain alternations (no word boundaries) keep the substring semantics of the original `in` checks.
+_COMPARISON_RE = re.compile(r" vs | versus |compare |comparison")
+_BY_CATEGORY_RE = re.compile(r"(?:by|per) category")
+_TOP_RE = re.compile(r"top|best[- ]selling")
+_BOTTOM_RE = re.compile(r"worst|lowest|bottom")
+_ENTITY_RE = re.compile(r"product|categor(?:y|ies)")
+_CATEGORY_WORD_RE = re.compile(r"categor(?:y|ies)")
+_BREAKDOWN_RE = re.compile(r"break ?down|category[- ]wise")
+_TREND_RE = re.compile(r"trend|over time|year by year")
+_GROWTH_RE = re.compile(r"year[- ]over[- ]year|yoy|growth|declin")
+_GAP_RE = re.compile(r"gap|difference|increase|decrease")
+_LAST_3_YEARS_RE = re.compile(r"last (?:3|three) years")
+_TOTAL_RE = re.compile(r"total (?:sales|revenue)|how much (?:did we sell|revenue)")
+_BY_PRODUCT_RE = re.compile(r"which products|by product|across all products|rank products")
+_ACROSS_CATEGORIES_RE = re.compile(r"category generates|between categories|categories performing|different categories")
+_OVERVIEW_RE = re.compile(r"overall|overview|how are we doing|sales performance|business performing")
+
+
+# INTENTS is static, so the allowed-options guide is serialised once.
+_ALLOWED_GUIDE_JSON = json.dumps(
+    {
+        "intents": list(INTENTS.keys()),
+        "metrics": ["total_revenue"],
+        "dimensions": ["year", "category", "product"],
+        "filters": {
+            "years": "array of integers",
+            "year_from": "integer",
+            "year_to": "integer",
+            "year": "integer",
+            "category": "string",
+            "categories": "array of strings",
+            "product_id": "integer",
+            "product_name": "string",
+            "limit": "integer (1-50)",
+            "order": "string ('top'|'bottom')",
+            "entity": "string ('product'|'category')",
+            "year_count": "integer (1-20)",
+            "average": "boolean",
         },
-        indent=2,
-    )
+        "charts": ["line", "bar"],
+    },
+    indent=2,
+)
+
+
+_SYSTEM_PROMPT = (
+    "You are a strict JSON intent parser. "
+    "You MUST output a single JSON object and nothing else. "
+    "No markdown, no code fences, no comments. "
+    "Never output SQL. "
+    "Only use allowed intents/metrics/dimensions/filters."
+)
+
+# Everything in the Gemini prompt except the question is static, so it is built once at import.
+# The question goes last so the shared prefix is identical across requests.
+_PROMPT_PREFIX = f"""
+{_SYSTEM_PROMPT}
+
+{_SCHEMA_DESCRIPTION}
+
+Allowed options (must adhere):
+{_ALLOWED_GUIDE_JSON}
+
+Return JSON with shape:
+{{
+  "intent": string,
+  "metrics": [string],
+  "dimensions": [string],
+  "filters": object,
+  "chart": "line"|"bar"
+}}
+""".strip()
 
 
 def _normalize_category(raw: str | None) -> str | None:
@@ -58,26 +126,23 @@ def _normalize_category(raw: str | None) -> str | None:
 
 
 def _extract_category(text: str) -> str | None:
-    import re
-
     t = text.strip()
     # Common patterns:
     # - "in Toyota category"
     # - "only in the Nissan category"
     # - "category Nissan" / "category: Toyota"
-    m = re.search(r"\b(?:only\s+)?in\s+the\s+([\w &/\-]+?)\s+category\b", t, re.IGNORECASE)
+    m = _CAT_IN_THE_RE.search(t)
     if not m:
-        m = re.search(r"\b(?:only\s+)?in\s+([\w &/\-]+?)\s+category\b", t, re.IGNORECASE)
+        m = _CAT_IN_RE.search(t)
     if not m:
-        m = re.search(r"\bcategory\s*[:=]?\s*([\w &/\-]+)\b", t, re.IGNORECASE)
+        m = _CAT_KV_RE.search(t)
     if not m:
         return None
     return _normalize_category(m.group(1))
 
 
 def _mentions_comparison(text: str) -> bool:
-    t = text.lower()
-    return any(k in t for k in (" vs ", " versus ", "compare ", "comparison"))
+    return _COMPARISON_RE.search(text) is not None
 
 
 # Stub parse is called when there is gemini api keys or if you have reached rate limits on gemini api
@@ -86,66 +151,64 @@ def _mentions_comparison(text: str) -> bool:
 def _stub_parse(question: str) -> dict[str, Any]:
     q = question.lower()
     category = _extract_category(question)
+    years_found = _find_years(q)
 
-    def _base_filters() -> dict[str, Any]:
-        f: dict[str, Any] = {}
-        if category:
-            f["category"] = category
-        return f
+    # Shared by every branch; always copied into a branch's filters, never mutated.
+    base_filters: dict[str, Any] = {"category": category} if category else {}
 
     # Only use revenue_by_category when user asks for a breakdown/grouping.
-    if any(k in q for k in ("by category", "per category", "group by category", "grouped by category", "breakdown by category")):
-        year = _extract_year(q)
+    if _BY_CATEGORY_RE.search(q):
+        year = _extract_year(years_found)
         payload: dict[str, Any] = {
             "intent": "sales_by_category",
             "metrics": ["total_revenue"],
             "dimensions": ["category"],
-            "filters": _base_filters(),
+            "filters": {**base_filters},
             "chart": "bar",
         }
         if year is not None:
             payload["filters"]["year"] = year
         return payload
 
-    if ("top" in q or "best-selling" in q or "best selling" in q) and ("product" in q or "products" in q or "category" in q or "categories" in q):
-        year = _extract_year(q)
+    if _TOP_RE.search(q) and _ENTITY_RE.search(q):
+        year = _extract_year(years_found)
         limit = _extract_limit(q) or 10     # fallback to limit of 10
-        entity = "category" if ("category" in q or "categories" in q) else "product"
+        entity = "category" if _CATEGORY_WORD_RE.search(q) else "product"
         payload = {
             "intent": "top_bottom_performers",
             "metrics": ["total_revenue"],
             "dimensions": [entity],
-            "filters": {**_base_filters(), "limit": limit, "order": "top", "entity": entity},
+            "filters": {**base_filters, "limit": limit, "order": "top", "entity": entity},
             "chart": "bar",
         }
         if year is not None:
             payload["filters"]["year"] = year
         return payload
 
-    if any(k in q for k in ("worst", "lowest", "bottom")) and ("product" in q or "products" in q or "category" in q or "categories" in q):
-        year = _extract_year(q)
+    if _BOTTOM_RE.search(q) and _ENTITY_RE.search(q):
+        year = _extract_year(years_found)
         limit = _extract_limit(q) or 5     # fallback to limit of 5
-        entity = "category" if ("category" in q or "categories" in q) else "product"
+        entity = "category" if _CATEGORY_WORD_RE.search(q) else "product"
         payload = {
             "intent": "top_bottom_performers",
             "metrics": ["total_revenue"],
             "dimensions": [entity],
-            "filters": {**_base_filters(), "limit": limit, "order": "bottom", "entity": entity},
+            "filters": {**base_filters, "limit": limit, "order": "bottom", "entity": entity},
             "chart": "bar",
         }
         if year is not None:
             payload["filters"]["year"] = year
         return payload
 
-    if any(k in q for k in ("break down", "breakdown", "category-wise", "category wise")):
-        year = _extract_year(q)
+    if _BREAKDOWN_RE.search(q):
+        year = _extract_year(years_found)
         if year is not None:
-            dim = "category" if ("category" in q or "categories" in q) else "product"
+            dim = "category" if _CATEGORY_WORD_RE.search(q) else "product"
             return {
                 "intent": "sales_breakdown_for_year",
                 "metrics": ["total_revenue"],
                 "dimensions": [dim],
-                "filters": {**_base_filters(), "year": year},
+                "filters": {**base_filters, "year": year},
                 "chart": "bar",
             }
 
@@ -157,12 +220,10 @@ def _stub_parse(question: str) -> dict[str, Any]:
             filters["year_from"] = year_from
         if year_to is not None:
             filters["year_to"] = year_to
-        filters.update(_base_filters())
-
-        import re
+        filters.update(base_filters)
 
-        m = re.search(r"\"([^\"]+)\"", question)
-        if m and ("trend" in q or "over time" in q or "year by year" in q):
+        m = _QUOTED_RE.search(question)
+        if m and _TREND_RE.search(q):
             filters["product_name"] = m.group(1).strip()
             return {
                 "intent": "product_sales_trend",
@@ -173,7 +234,7 @@ def _stub_parse(question: str) -> dict[str, Any]:
             }
 
         # Growth analysis
-        if any(k in q for k in ("year-over-year", "year over year", "yoy", "growth", "declin")):
+        if _GROWTH_RE.search(q):
             return {
                 "intent": "sales_growth_analysis",
                 "metrics": ["total_revenue"],
@@ -190,9 +251,9 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "line",
         }
 
-    years = _extract_two_years(q)
-    if years is not None and _mentions_comparison(question):
-        filters: dict[str, Any] = {"years": years, **_base_filters()}
+    years = _extract_two_years(years_found)
+    if years is not None and _mentions_comparison(q):
+        filters: dict[str, Any] = {"years": years, **base_filters}
         return {
             "intent": "sales_comparison_by_year",
             "metrics": ["total_revenue"],
@@ -201,8 +262,8 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if years is not None and any(k in q for k in ("gap", "difference", "increase", "decrease")):
-        filters: dict[str, Any] = {"years": years, **_base_filters()}
+    if years is not None and _GAP_RE.search(q):
+        filters: dict[str, Any] = {"years": years, **base_filters}
         return {
             "intent": "sales_comparison_by_year",
             "metrics": ["total_revenue"],
@@ -211,8 +272,8 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if any(k in q for k in ("last 3 years", "last three years")):
-        filters = {**_base_filters(), "year_count": 3}
+    if _LAST_3_YEARS_RE.search(q):
+        filters = {**base_filters, "year_count": 3}
         return {
             "intent": "multi_year_comparison",
             "metrics": ["total_revenue"],
@@ -221,8 +282,8 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if "average" in q and ("year" in q or "yearly" in q):
-        filters = {**_base_filters(), "year_count": 5, "average": True}
+    if "average" in q and "year" in q:
+        filters = {**base_filters, "year_count": 5, "average": True}
         return {
             "intent": "multi_year_comparison",
             "metrics": ["total_revenue"],
@@ -231,20 +292,20 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if any(k in q for k in ("total sales", "total revenue", "how much did we sell", "how much revenue")):
-        year = _extract_year(q)
+    if _TOTAL_RE.search(q):
+        year = _extract_year(years_found)
         if year is not None:
             return {
                 "intent": "total_sales_for_period",
                 "metrics": ["total_revenue"],
                 "dimensions": ["year"],
-                "filters": {**_base_filters(), "year": year},
+                "filters": {**base_filters, "year": year},
                 "chart": "bar",
             }
 
-    if any(k in q for k in ("which products", "by product", "across all products", "rank products")):
-        year = _extract_year(q)
-        filters = _base_filters()
+    if _BY_PRODUCT_RE.search(q):
+        year = _extract_year(years_found)
+        filters = {**base_filters}
         if year is not None:
             filters["year"] = year
         return {
@@ -255,9 +316,9 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if any(k in q for k in ("category generates", "between categories", "categories performing", "different categories")):
-        year = _extract_year(q)
-        filters = _base_filters()
+    if _ACROSS_CATEGORIES_RE.search(q):
+        year = _extract_year(years_found)
+        filters = {**base_filters}
         if year is not None:
             filters["year"] = year
         return {
@@ -268,7 +329,7 @@ def _stub_parse(question: str) -> dict[str, Any]:
             "chart": "bar",
         }
 
-    if any(k in q for k in ("overall", "overview", "how are we doing", "sales performance", "business performing")):
+    if _OVERVIEW_RE.search(q):
         return {
             "intent": "clarification_required",
             "metrics": ["total_revenue"],
@@ -278,7 +339,7 @@ def _stub_parse(question: str) -> dict[str, Any]:
         }
 
     # Default to a sales trend over time
-    filters: dict[str, Any] = _base_filters()
+    filters: dict[str, Any] = {**base_filters}
     return {
         "intent": "sales_trend_over_time",
         "metrics": ["total_revenue"],
@@ -288,48 +349,43 @@ def _stub_parse(question: str) -> dict[str, Any]:
     }
 
 
-def _extract_year(text: str) -> int | None:
-    for year in range(2015, 2031):
-        if str(year) in text:
-            return year
-    return None
+# Distinct years mentioned in the text, in ascending order.
+def _find_years(text: str) -> list[int]:
+    return sorted({int(y) for y in _YEAR_RE.findall(text)})
+
 
+def _extract_year(years: list[int]) -> int | None:
+    return years[0] if years else None
 
-def _extract_two_years(text: str) -> list[int] | None:
-    found = []
-    for year in range(2015, 2031):
-        if str(year) in text:
-            found.append(year)
-    unique = sorted(set(found))
-    if len(unique) >= 2:
-        return unique[:2]
+
+def _extract_two_years(years: list[int]) -> list[int] | None:
+    if len(years) >= 2:
+        return years[:2]
     return None
 
 
 def _extract_year_range(text: str) -> tuple[int | None, int | None]:
     # naive patterns like 2020-2026
-    import re
-
-    m = re.search(r"(20\d{2})\s*[-–]\s*(20\d{2})", text)
+    m = _RANGE_DASH_RE.search(text)
     if m:
         return int(m.group(1)), int(m.group(2))
 
     # Patterns like "2021 to 2026" or "2021 through 2026"
-    m = re.search(r"(20\d{2})\s+(?:to|through|thru)\s+(20\d{2})", text)
+    m = _RANGE_TO_RE.search(text)
     if m:
         return int(m.group(1)), int(m.group(2))
 
     # Pattern like "between 2021 and 2026"
-    m = re.search(r"between\s+(20\d{2})\s+and\s+(20\d{2})", text)
+    m = _BETWEEN_RE.search(text)
     if m:
         return int(m.group(1)), int(m.group(2))
 
     year_from = None
     year_to = None
-    m = re.search(r"from\s+(20\d{2})", text)
+    m = _FROM_RE.search(text)
     if m:
         year_from = int(m.group(1))
-    m = re.search(r"to\s+(20\d{2})", text)
+    m = _TO_RE.search(text)
     if m:
         year_to = int(m.group(1))
 
@@ -337,9 +393,7 @@ def _extract_year_range(text: str) -> tuple[int | None, int | None]:
 
 
 def _extract_limit(text: str) -> int | None:
-    import re
-
-    m = re.search(r"top\s+(\d+)", text)
+    m = _LIMIT_RE.search(text)
     if not m:
         return None
     try:
@@ -348,64 +402,101 @@ def _extract_limit(text: str) -> int | None:
         return None
 
 
-# Parses user's question to determine intent. Uses gemini API if available and falls back to pattern primitive recognition if not available
-def parse_intent(question: str) -> dict[str, Any]:
+# Gemini model handle, resolved once by init_parser(); None means every question goes to the stub parser.
+_gemini_model: Any | None = None
+_parser_initialized = False
+# After a failed Gemini call, questions go to the stub parser until this monotonic deadline.
+_gemini_retry_at = 0.0
+
+# Gemini intents as JSON text by exact question text, least recently used first. Dashboards re-ask the
+# same questions, and each Gemini answer costs a paid round-trip. Stored as text so every hit decodes a
+# fresh dict that callers may mutate; stub answers are as cheap to recompute as that, so skip the cache.
+_INTENT_CACHE_SIZE = 2048
+_intent_cache: OrderedDict[str, str] = OrderedDict()
+
+
+# Decide once (at startup) whether questions are parsed by Gemini or by the stub parser.
+def init_parser() -> None:
+    global _gemini_model, _parser_initialized
+    _parser_initialized = True
+    _gemini_model = None
+    _intent_cache.clear()
+
     if settings.llm_mode.lower() == "stub":
         print("⚠️  Using stub intent parser (set LLM_MODE=gemini to enable AI)")
-        return _stub_parse(question)
+        return
 
     if not settings.gemini_api_key:
         print("⚠️  GEMINI_API_KEY is not set; falling back to stub parser")
-        return _stub_parse(question)
+        return
 
     try:
         import google.generativeai as genai
     except Exception:  # pragma: no cover
         print("⚠️  Gemini SDK not available; falling back to stub parser")
-        return _stub_parse(question)
+        return
 
     genai.configure(api_key=settings.gemini_api_key)
     print(f"✅  Using Gemini model: {settings.gemini_model}")
-    model = genai.GenerativeModel(settings.gemini_model)
-
-    system = (
-        "You are a strict JSON intent parser. "
-        "You MUST output a single JSON object and nothing else. "
-        "No markdown, no code fences, no comments. "
-        "Never output SQL. "
-        "Only use allowed intents/metrics/dimensions/filters."
-    )
+    _gemini_model = genai.GenerativeModel(settings.gemini_model)
 
-    prompt = f"""
-{system}
 
-User question:
-{question}
-
-{_SCHEMA_DESCRIPTION}
+# Returns None when Gemini fails or answers with something that is not an intent object.
+async def _gemini_parse(question: str) -> dict[str, Any] | None:
+    global _gemini_retry_at
+    model = _gemini_model
+    prompt = f"{_PROMPT_PREFIX}\n\nUser question:\n{question}"
 
-Allowed options (must adhere):
-{_allowed_guide()}
+    # The Gemini SDK is blocking; run its network calls on a worker thread so the event loop stays free.
+    if settings.debug_tokens:
+        token_count = await anyio.to_thread.run_sync(model.count_tokens, prompt)
+        print("Input Token count:", token_count.total_tokens)
 
-Return JSON with shape:
-{{
-  "intent": string,
-  "metrics": [string],
-  "dimensions": [string],
-  "filters": object,
-  "chart": "line"|"bar"
-}}
-""".strip()
-    
-    print("Input Token count:", model.count_tokens(prompt).total_tokens)
+    # Hard deadline: on timeout the worker thread is abandoned (the SDK's own request timeout ends it)
+    # and the question is answered by the stub parser instead.
+    generate = functools.partial(
+        model.generate_content, prompt, request_options={"timeout": settings.gemini_timeout_seconds}
+    )
+    try:
+        with anyio.fail_after(settings.gemini_timeout_seconds):
+            resp = await anyio.to_thread.run_sync(generate, abandon_on_cancel=True)
+    except Exception:
+        _gemini_retry_at = time.monotonic() + settings.gemini_retry_after_seconds
+        print(f"⚠️  Gemini unavailable; using stub parser for the next {settings.gemini_retry_after_seconds:g}s")
+        return None
 
     try:
-        resp = model.generate_content(prompt)
         text = (resp.text or "").strip()
         payload = json.loads(text)
         if not isinstance(payload, dict):
             raise MCPError("Gemini output must be a JSON object")
         return payload
     except Exception:
-        print("⚠️  Gemini unavailable or invalid output; falling back to stub parser")
+        print("⚠️  Gemini returned invalid output; falling back to stub parser")
+        return None
+
+
+# Parses user's question to determine intent. Uses gemini API if available and falls back to pattern primitive recognition if not available
+async def parse_intent(question: str) -> dict[str, Any]:
+    if not _parser_initialized:
+        init_parser()
+
+    if _gemini_model is None:
+        return _stub_parse(question)
+
+    cached = _intent_cache.get(question)
+    if cached is not None:
+        _intent_cache.move_to_end(question)
+        return json.loads(cached)
+
+    if time.monotonic() < _gemini_retry_at:
         return _stub_parse(question)
+    payload = await _gemini_parse(question)
+    if payload is None:
+        # Fallback answers are not cached, so the question gets Gemini again once it recovers.
+        return _stub_parse(question)
+
+    _intent_cache[question] = json.dumps(payload)
+    if len(_intent_cache) > _INTENT_CACHE_SIZE:
+        _intent_cache.popitem(last=False)
+    return payload
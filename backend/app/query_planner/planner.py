@@ -1,18 +1,26 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Literal
+import functools
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Literal, Mapping, NamedTuple
 
-from sqlalchemy import text
+from sqlalchemy import TextClause, text
 
 from app.query_planner.catalog import INTENTS, DimensionName, IntentName, MetricName
 
 
-@dataclass(frozen=True)
+ChartType = Literal["line", "bar"]
+_CHART_VALUES = frozenset({"line", "bar"})
+_ENTITY_VALUES = frozenset({"product", "category"})
+_ORDER_VALUES = frozenset({"top", "bottom"})
+
+
+@dataclass(frozen=True, slots=True)
 class PlannedQuery:
-    sql: str
-    params: dict[str, Any]
-    chart_type: Literal["line", "bar"]
+    sql: TextClause | str
+    params: Mapping[str, Any]
+    chart_type: ChartType
     label_field: str
     value_field: str
     series_field: str | None = None
@@ -22,549 +30,547 @@ class QueryPlannerError(ValueError):
     pass
 
 
-def _validate_list(values: list[str], allowed: set[str], what: str) -> None:
-    for v in values:
-        if v not in allowed:
-            raise QueryPlannerError(f"Unsupported {what}: {v}")
+# SQL skeletons shared by the intent handlers; only the JOIN/WHERE fragments vary per call.
+_JOIN_PRODUCTS = "JOIN products p ON p.id = s.product_id"
+
+_YEARLY_TOTALS_SQL = """
+    SELECT s.year::TEXT AS label,
+           SUM(s.revenue)::DOUBLE PRECISION AS value
+    FROM sales s
+    {join}
+    {where}
+    GROUP BY s.year
+    ORDER BY s.year ASC
+"""
+
+# CAST() rather than :label::TEXT, which the bind-param scanner doesn't recognise as a parameter.
+_PERIOD_TOTAL_SQL = """
+    SELECT CAST(:label AS TEXT) AS label,
+           COALESCE(SUM(s.revenue), 0)::DOUBLE PRECISION AS value
+    FROM sales s
+    {join}
+    {where}
+"""
+
+_GROUPED_TOTALS_SQL = """
+    SELECT {label} AS label,
+           SUM(s.revenue)::DOUBLE PRECISION AS value
+    FROM sales s
+    JOIN products p ON p.id = s.product_id
+    {where}
+    GROUP BY {label}
+    ORDER BY value {order}
+    {limit}
+"""
+
+_YEARLY_GROWTH_SQL = """
+    WITH yearly AS (
+      SELECT s.year,
+             SUM(s.revenue)::NUMERIC AS revenue
+      FROM sales s
+      {join}
+      {where}
+      GROUP BY s.year
+    )
+    SELECT y.year::TEXT AS label,
+           (y.revenue - LAG(y.revenue) OVER (ORDER BY y.year))::DOUBLE PRECISION AS value
+    FROM yearly y
+    ORDER BY y.year ASC
+"""
+
+_AVERAGE_YEARLY_SQL = """
+    WITH max_year AS (SELECT MAX(year) AS y FROM sales),
+         yearly AS (
+           SELECT s.year,
+                  SUM(s.revenue)::NUMERIC AS revenue
+           FROM sales s
+           {join}
+           WHERE s.year >= (SELECT y FROM max_year) - :year_count + 1
+           {extra_where}
+           GROUP BY s.year
+         )
+    SELECT 'avg'::TEXT AS label,
+           AVG(revenue)::DOUBLE PRECISION AS value
+    FROM yearly
+"""
+
+_RECENT_YEARS_SQL = """
+    WITH max_year AS (SELECT MAX(year) AS y FROM sales)
+    SELECT s.year::TEXT AS label,
+           SUM(s.revenue)::DOUBLE PRECISION AS value
+    FROM sales s
+    {join}
+    WHERE s.year >= (SELECT y FROM max_year) - :year_count + 1
+    {extra_where}
+    GROUP BY s.year
+    ORDER BY s.year ASC
+"""
+
+_EMPTY_CHART_SQL = "SELECT 1::TEXT AS label, 0::DOUBLE PRECISION AS value WHERE FALSE"
+
+
+# The fragments come from a small fixed vocabulary, so the set of distinct statements is bounded;
+# each is run through text()'s bind-param scan once and the TextClause is reused afterwards.
+@functools.lru_cache(maxsize=256)
+def _sql(template: str, **parts: str) -> TextClause:
+    return text(template.format(**parts))
+
+
+def _validate_list(values: list[str], allowed: frozenset[str], what: str) -> None:
+    # The valid case is a single C-level subset check; only a failure walks the list, to name the first miss.
+    if not values or allowed.issuperset(values):
+        return
+    bad = next(v for v in values if v not in allowed)
+    raise QueryPlannerError(f"Unsupported {what}: {bad}")
+
+
+class NormalizedFilters(NamedTuple):
+    year: int | None
+    year_from: int | None
+    year_to: int | None
+    years: list[Any] | None
+    category: str | None
+    categories: list[str] | None
+    product_id: int | None
+    product_name_ilike: str | None
+    limit: int | None
+    entity: str | None
+    order: str | None
+    year_count: int | None
+    average: bool
+
+
+# Payloads are decoded JSON, so values are exactly int/str/list/dict and exact type checks suffice. They
+# are also stricter: bool subclasses int, and True/False are not years, ids or limits.
+def _int_or_none(value: Any) -> int | None:
+    return value if type(value) is int else None
+
+
+# A name that already contains a wildcard is taken as the caller's own pattern; anything else matches
+# as a substring. Not "always wrap": that would turn a deliberate prefix pattern like "Toy%" into "%Toy%".
+def _ilike_any(name: str) -> str:
+    return name if "%" in name else "%" + name + "%"
+
+
+# All type checks, stripping, lower-casing and ILIKE wrapping happen here once; the intent handlers
+# only read fields and apply their own bounds/defaults.
+def _normalize_filters(filters: dict[str, Any]) -> NormalizedFilters:
+    years = filters.get("years")
+    category = filters.get("category")
+    categories = filters.get("categories")
+    product_name = filters.get("product_name")
+    entity = filters.get("entity")
+    order = filters.get("order")
+
+    cleaned = None
+    if type(categories) is list and categories:
+        # Only drop non-strings and blanks here; trimming and lower-casing happen in SQL.
+        cleaned = [c for c in categories if type(c) is str and c.strip()] or None
+
+    name = product_name.strip() if type(product_name) is str else ""
+
+    return NormalizedFilters(
+        year=_int_or_none(filters.get("year")),
+        year_from=_int_or_none(filters.get("year_from")),
+        year_to=_int_or_none(filters.get("year_to")),
+        years=years if type(years) is list and years else None,
+        category=category.strip() if type(category) is str and category.strip() else None,
+        categories=cleaned,
+        product_id=_int_or_none(filters.get("product_id")),
+        product_name_ilike=_ilike_any(name) if name else None,
+        limit=_int_or_none(filters.get("limit")),
+        entity=entity if type(entity) is str and entity in _ENTITY_VALUES else None,
+        order=order if type(order) is str and order in _ORDER_VALUES else None,
+        year_count=_int_or_none(filters.get("year_count")),
+        average=bool(filters.get("average")),
+    )
+
+
+# Every WHERE condition a handler can emit, as (bit, SQL, param/field name, needs products join), in the
+# order they appear in the clause. A handler ORs together the bits of the filters it applies.
+_W_YEAR, _W_YEARS, _W_YEAR_FROM, _W_YEAR_TO, _W_PRODUCT_ID, _W_CATEGORY, _W_CATEGORIES, _W_PRODUCT_NAME = (
+    1 << i for i in range(8)
+)
+_W_YEAR_RANGE = _W_YEAR_FROM | _W_YEAR_TO
+
+_CONDITIONS = (
+    (_W_YEAR, "s.year = :year", "year", False),
+    (_W_YEARS, "s.year = ANY(:years)", "years", False),
+    (_W_YEAR_FROM, "s.year >= :year_from", "year_from", False),
+    (_W_YEAR_TO, "s.year <= :year_to", "year_to", False),
+    (_W_PRODUCT_ID, "s.product_id = :product_id", "product_id", False),
+    (_W_CATEGORY, "lower(p.category) = lower(:category)", "category", True),
+    # Compare lower-cased values to be case-insensitive.
+    (
+        _W_CATEGORIES,
+        "lower(p.category) = ANY(ARRAY(SELECT lower(btrim(x)) FROM unnest(CAST(:categories AS text[])) x))",
+        "categories",
+        True,
+    ),
+    (_W_PRODUCT_NAME, "p.name ILIKE :product_name", "product_name", True),
+)
+
+# The NormalizedFilters field each bound parameter is read from.
+_PARAM_FIELDS = {"product_name": "product_name_ilike"}
+
+
+def _build_where(mask: int) -> tuple[str, tuple[tuple[str, str], ...], bool]:
+    active = [c for c in _CONDITIONS if mask & c[0]]
+    where_sql = ("WHERE " + " AND ".join(c[1] for c in active)) if active else ""
+    params = tuple((c[2], _PARAM_FIELDS.get(c[2], c[2])) for c in active)
+    return where_sql, params, any(c[3] for c in active)
+
+
+# All 256 combinations are assembled once at import; a plan is then one dict lookup.
+_WHERE_BY_MASK = {mask: _build_where(mask) for mask in range(1 << len(_CONDITIONS))}
+
+
+# Which filters are present, restricted to the conditions a handler supports. A single year (or an
+# explicit years list) takes precedence over a range, and a single category over a list.
+def _filter_mask(filters: NormalizedFilters, allowed: int) -> int:
+    mask = 0
+    if filters.year is not None:
+        mask |= _W_YEAR
+    if filters.years is not None:
+        mask |= _W_YEARS
+    if filters.year_from is not None:
+        mask |= _W_YEAR_FROM
+    if filters.year_to is not None:
+        mask |= _W_YEAR_TO
+    if filters.product_id is not None:
+        mask |= _W_PRODUCT_ID
+    if filters.category is not None:
+        mask |= _W_CATEGORY
+    if filters.categories is not None:
+        mask |= _W_CATEGORIES
+    if filters.product_name_ilike is not None:
+        mask |= _W_PRODUCT_NAME
+
+    mask &= allowed
+    if mask & (_W_YEAR | _W_YEARS):
+        mask &= ~_W_YEAR_RANGE
+    if mask & _W_CATEGORY:
+        mask &= ~_W_CATEGORIES
+    return mask
+
+
+# Returns the WHERE clause, its params (plus any fixed ones, e.g. limit) built in one go, and whether
+# the products join is needed.
+def _where(filters: NormalizedFilters, mask: int, **fixed: Any) -> tuple[str, dict[str, Any], bool]:
+    where_sql, names, join_products = _WHERE_BY_MASK[mask]
+    params = {name: getattr(filters, field) for name, field in names}
+    if fixed:
+        params.update(fixed)
+    return where_sql, params, join_products
 
-# Based on payload and payload data, plan an SQL query
-def plan_intent(intent_payload: dict[str, Any]) -> PlannedQuery:
-    intent = intent_payload.get("intent")
-    if intent not in INTENTS:
-        raise QueryPlannerError(f"Unsupported intent: {intent}")
 
-    spec = INTENTS[intent]
+def _plan_sales_trend(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    mask = _filter_mask(
+        filters, _W_YEARS | _W_YEAR_RANGE | _W_PRODUCT_ID | _W_CATEGORY | _W_CATEGORIES | _W_PRODUCT_NAME
+    )
+    where_sql, params, join_products = _where(filters, mask)
 
-    metrics = intent_payload.get("metrics") or []
-    dimensions = intent_payload.get("dimensions") or []
-    filters = intent_payload.get("filters") or {}
+    join_sql = _JOIN_PRODUCTS if join_products else ""
 
-    if not isinstance(metrics, list) or not isinstance(dimensions, list) or not isinstance(filters, dict):
-        raise QueryPlannerError("Invalid intent JSON: metrics/dimensions/filters types")
+    sql = _sql(_YEARLY_TOTALS_SQL, join=join_sql, where=where_sql)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    _validate_list(metrics, set(spec.allowed_metrics), "metric")
-    _validate_list(dimensions, set(spec.allowed_dimensions), "dimension")
 
-    chart = intent_payload.get("chart") or spec.default_chart
-    if chart not in ("line", "bar"):
-        chart = spec.default_chart
+def _plan_sales_comparison_by_year(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    if filters.years is None:
+        # Compare the two ends of a range rather than every year in between.
+        yr_list = sorted({y for y in (filters.year_from, filters.year_to) if y is not None})
+        filters = filters._replace(years=yr_list or None)
 
-    intent_name: IntentName = intent
-    # metric0: MetricName = metrics[0] if metrics else "total_revenue"
-    dim0: DimensionName = dimensions[0] if dimensions else list(spec.allowed_dimensions)[0]
-
-    if intent_name in ("sales_trend", "sales_comparison", "sales_trend_over_time"):
-        years = filters.get("years")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        category = filters.get("category")
-        categories = filters.get("categories")
-        product_id = filters.get("product_id")
-        product_name = filters.get("product_name")
-
-        where = []
-        params: dict[str, Any] = {}
-
-        join_products = bool(category or categories or product_name)
-
-        if isinstance(years, list) and years:
-            where.append("s.year = ANY(:years)")
-            params["years"] = years
-        else:
-            if isinstance(year_from, int):
-                where.append("s.year >= :year_from")
-                params["year_from"] = year_from
-            if isinstance(year_to, int):
-                where.append("s.year <= :year_to")
-                params["year_to"] = year_to
-
-        if isinstance(product_id, int):
-            where.append("s.product_id = :product_id")
-            params["product_id"] = product_id
-
-        if isinstance(category, str) and category.strip():
-            join_products = True
-            where.append("lower(p.category) = lower(:category)")
-            params["category"] = category.strip()
-        elif isinstance(categories, list) and categories:
-            # Compare lower-cased values to be case-insensitive.
-            cleaned = [str(c).strip().lower() for c in categories if str(c).strip()]
-            if cleaned:
-                join_products = True
-                where.append("lower(p.category) = ANY(:categories)")
-                params["categories"] = cleaned
-
-        if isinstance(product_name, str) and product_name.strip():
-            join_products = True
-            name = product_name.strip()
-
-            if "%" not in name:
-                name = f"%{name}%"
-            where.append("p.name ILIKE :product_name")
-            params["product_name"] = name
-
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        join_sql = "JOIN products p ON p.id = s.product_id" if join_products else ""
-
-        sql = f"""
-            SELECT s.year::TEXT AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            {join_sql}
-            {where_sql}
-            GROUP BY s.year
-            ORDER BY s.year ASC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    mask = _filter_mask(filters, _W_YEARS | _W_PRODUCT_ID | _W_CATEGORY | _W_PRODUCT_NAME)
+    where_sql, params, join_products = _where(filters, mask)
 
-    if intent_name == "sales_comparison_by_year":
-        years = filters.get("years")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        category = filters.get("category")
-        product_id = filters.get("product_id")
-        product_name = filters.get("product_name")
-
-        where = []
-        params: dict[str, Any] = {}
-        join_products = bool(category or product_name)
-
-        if isinstance(years, list) and years:
-            where.append("s.year = ANY(:years)")
-            params["years"] = years
-        else:
-            yr_list = []
-            if isinstance(year_from, int):
-                yr_list.append(year_from)
-            if isinstance(year_to, int):
-                yr_list.append(year_to)
-            yr_list = sorted(set(yr_list))
-            if yr_list:
-                where.append("s.year = ANY(:years)")
-                params["years"] = yr_list
-
-        if isinstance(product_id, int):
-            where.append("s.product_id = :product_id")
-            params["product_id"] = product_id
-
-        if isinstance(category, str) and category.strip():
-            join_products = True
-            where.append("lower(p.category) = lower(:category)")
-            params["category"] = category.strip()
-
-        if isinstance(product_name, str) and product_name.strip():
-            join_products = True
-            name = product_name.strip()
-            if "%" not in name:
-                name = f"%{name}%"
-            where.append("p.name ILIKE :product_name")
-            params["product_name"] = name
-
-        join_sql = "JOIN products p ON p.id = s.product_id" if join_products else ""
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        sql = f"""
-            SELECT s.year::TEXT AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            {join_sql}
-            {where_sql}
-            GROUP BY s.year
-            ORDER BY s.year ASC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    join_sql = _JOIN_PRODUCTS if join_products else ""
 
-    if intent_name == "total_sales_for_period":
-        year = filters.get("year")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        category = filters.get("category")
-        product_id = filters.get("product_id")
-        product_name = filters.get("product_name")
-
-        where = []
-        params: dict[str, Any] = {}
-        join_products = bool(category or product_name)
-
-        if isinstance(year, int):
-            where.append("s.year = :year")
-            params["year"] = year
-            label = str(year)
-        else:
-            if isinstance(year_from, int):
-                where.append("s.year >= :year_from")
-                params["year_from"] = year_from
-            if isinstance(year_to, int):
-                where.append("s.year <= :year_to")
-                params["year_to"] = year_to
-            if isinstance(year_from, int) and isinstance(year_to, int):
-                label = f"{year_from}-{year_to}"
-            else:
-                label = "total"
-
-        if isinstance(product_id, int):
-            where.append("s.product_id = :product_id")
-            params["product_id"] = product_id
-
-        if isinstance(category, str) and category.strip():
-            join_products = True
-            where.append("lower(p.category) = lower(:category)")
-            params["category"] = category.strip()
-
-        if isinstance(product_name, str) and product_name.strip():
-            join_products = True
-            name = product_name.strip()
-            if "%" not in name:
-                name = f"%{name}%"
-            where.append("p.name ILIKE :product_name")
-            params["product_name"] = name
-
-        join_sql = "JOIN products p ON p.id = s.product_id" if join_products else ""
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        sql = f"""
-            SELECT :label::TEXT AS label,
-                   COALESCE(SUM(s.revenue), 0)::NUMERIC AS value
-            FROM sales s
-            {join_sql}
-            {where_sql}
-        """
-        params["label"] = label
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    sql = _sql(_YEARLY_TOTALS_SQL, join=join_sql, where=where_sql)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    if intent_name == "sales_by_product":
-        year = filters.get("year")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        category = filters.get("category")
-        limit = filters.get("limit")
-        if not isinstance(limit, int) or limit <= 0 or limit > 100:
-            limit = 20
-
-        where = []
-        params: dict[str, Any] = {"limit": limit}
-
-        if isinstance(year, int):
-            where.append("s.year = :year")
-            params["year"] = year
-        else:
-            if isinstance(year_from, int):
-                where.append("s.year >= :year_from")
-                params["year_from"] = year_from
-            if isinstance(year_to, int):
-                where.append("s.year <= :year_to")
-                params["year_to"] = year_to
-
-        if isinstance(category, str) and category.strip():
-            where.append("lower(p.category) = lower(:category)")
-            params["category"] = category.strip()
-
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        sql = f"""
-            SELECT p.name AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY p.name
-            ORDER BY value DESC
-            LIMIT :limit
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    if intent_name == "product_sales_trend":
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        product_id = filters.get("product_id")
-        product_name = filters.get("product_name")
-
-        where = []
-        params: dict[str, Any] = {}
-
-        if isinstance(year_from, int):
-            where.append("s.year >= :year_from")
-            params["year_from"] = year_from
-        if isinstance(year_to, int):
-            where.append("s.year <= :year_to")
-            params["year_to"] = year_to
-
-        if isinstance(product_id, int):
-            where.append("s.product_id = :product_id")
-            params["product_id"] = product_id
-        elif isinstance(product_name, str) and product_name.strip():
-            name = product_name.strip()
-            if "%" not in name:
-                name = f"%{name}%"
-            where.append("p.name ILIKE :product_name")
-            params["product_name"] = name
-        else:
-            raise QueryPlannerError("product_sales_trend requires product_id or product_name")
-
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-        sql = f"""
-            SELECT s.year::TEXT AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY s.year
-            ORDER BY s.year ASC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+def _plan_total_sales_for_period(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    if filters.year is not None:
+        label = str(filters.year)
+    elif filters.year_from is not None and filters.year_to is not None:
+        label = f"{filters.year_from}-{filters.year_to}"
+    else:
+        label = "total"
 
-    if intent_name == "sales_by_category":
-        year = filters.get("year")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-
-        where = []
-        params: dict[str, Any] = {}
-
-        if isinstance(year, int):
-            where.append("s.year = :year")
-            params["year"] = year
-        else:
-            if isinstance(year_from, int):
-                where.append("s.year >= :year_from")
-                params["year_from"] = year_from
-            if isinstance(year_to, int):
-                where.append("s.year <= :year_to")
-                params["year_to"] = year_to
-
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        sql = f"""
-            SELECT p.category AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY p.category
-            ORDER BY value DESC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    mask = _filter_mask(filters, _W_YEAR | _W_YEAR_RANGE | _W_PRODUCT_ID | _W_CATEGORY | _W_PRODUCT_NAME)
+    where_sql, params, join_products = _where(filters, mask, label=label)
 
-    if intent_name == "top_bottom_performers":
-        year = filters.get("year")
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        entity = filters.get("entity")  # 'product' or 'category'
-        order = filters.get("order")  # 'top' or 'bottom'
-        limit = filters.get("limit")
-
-        if entity not in ("product", "category"):
-            # Allow dimensions to guide the grouping
-            entity = dim0 if dim0 in ("product", "category") else "product"
-
-        if order not in ("top", "bottom"):
-            order = "top"
-
-        if not isinstance(limit, int) or limit <= 0 or limit > 50:
-            limit = 5
-
-        where = []
-        params: dict[str, Any] = {"limit": limit}
-
-        if isinstance(year, int):
-            where.append("s.year = :year")
-            params["year"] = year
-        else:
-            if isinstance(year_from, int):
-                where.append("s.year >= :year_from")
-                params["year_from"] = year_from
-            if isinstance(year_to, int):
-                where.append("s.year <= :year_to")
-                params["year_to"] = year_to
-
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        if entity == "category":
-            label_expr = "p.category"
-            group_expr = "p.category"
-        else:
-            label_expr = "p.name"
-            group_expr = "p.name"
-
-        order_sql = "DESC" if order == "top" else "ASC"
-
-        sql = f"""
-            SELECT {label_expr} AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY {group_expr}
-            ORDER BY value {order_sql}
-            LIMIT :limit
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    join_sql = _JOIN_PRODUCTS if join_products else ""
 
-    if intent_name == "sales_breakdown_for_year":
-        year = filters.get("year")
-        if not isinstance(year, int):
-            raise QueryPlannerError("sales_breakdown_for_year requires filter.year")
-
-        params: dict[str, Any] = {"year": year}
-
-        if dim0 == "category":
-            label_expr = "p.category"
-            group_expr = "p.category"
-        else:
-            label_expr = "p.name"
-            group_expr = "p.name"
-
-        sql = f"""
-            SELECT {label_expr} AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            WHERE s.year = :year
-            GROUP BY {group_expr}
-            ORDER BY value DESC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    sql = _sql(_PERIOD_TOTAL_SQL, join=join_sql, where=where_sql)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_sales_by_product(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    limit = filters.limit
+    if limit is None or limit <= 0 or limit > 100:
+        limit = 20
+
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR | _W_YEAR_RANGE | _W_CATEGORY), limit=limit)
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label="p.name", where=where_sql, order="DESC", limit="LIMIT :limit")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    if intent_name == "sales_growth_analysis":
-        year_from = filters.get("year_from")
-        year_to = filters.get("year_to")
-        category = filters.get("category")
-
-        where = []
-        params: dict[str, Any] = {}
-        join_products = bool(category)
-
-        if isinstance(year_from, int):
-            where.append("s.year >= :year_from")
-            params["year_from"] = year_from
-        if isinstance(year_to, int):
-            where.append("s.year <= :year_to")
-            params["year_to"] = year_to
-        if isinstance(category, str) and category.strip():
-            join_products = True
-            where.append("lower(p.category) = lower(:category)")
-            params["category"] = category.strip()
-
-        join_sql = "JOIN products p ON p.id = s.product_id" if join_products else ""
-        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-        sql = f"""
-            WITH yearly AS (
-              SELECT s.year,
-                     SUM(s.revenue)::NUMERIC AS revenue
-              FROM sales s
-              {join_sql}
-              {where_sql}
-              GROUP BY s.year
-            )
-            SELECT y.year::TEXT AS label,
-                   (y.revenue - LAG(y.revenue) OVER (ORDER BY y.year))::NUMERIC AS value
-            FROM yearly y
-            ORDER BY y.year ASC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    if intent_name == "multi_year_comparison":
-        year_count = filters.get("year_count")
-        average = filters.get("average")
-        category = filters.get("category")
+def _plan_product_sales_trend(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    if filters.product_id is not None:
+        product_bit = _W_PRODUCT_ID
+    elif filters.product_name_ilike is not None:
+        product_bit = _W_PRODUCT_NAME
+    else:
+        raise QueryPlannerError("product_sales_trend requires product_id or product_name")
 
-        if not isinstance(year_count, int) or year_count <= 0 or year_count > 20:
-            year_count = 3
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR_RANGE | product_bit))
 
-        params: dict[str, Any] = {"year_count": year_count}
+    sql = _sql(_YEARLY_TOTALS_SQL, join=_JOIN_PRODUCTS, where=where_sql)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-        join_products = bool(category)
+
+def _plan_sales_by_category(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR | _W_YEAR_RANGE))
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label="p.category", where=where_sql, order="DESC", limit="")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_top_bottom_performers(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    entity = filters.entity
+    if entity is None:
+        # Allow dimensions to guide the grouping
+        entity = dim0 if dim0 in _ENTITY_VALUES else "product"
+
+    order = filters.order or "top"
+
+    limit = filters.limit
+    if limit is None or limit <= 0 or limit > 50:
+        limit = 5
+
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR | _W_YEAR_RANGE), limit=limit)
+
+    label_expr = "p.category" if entity == "category" else "p.name"
+
+    order_sql = "DESC" if order == "top" else "ASC"
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label=label_expr, where=where_sql, order=order_sql, limit="LIMIT :limit")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_sales_breakdown_for_year(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    if filters.year is None:
+        raise QueryPlannerError("sales_breakdown_for_year requires filter.year")
+
+    params: dict[str, Any] = {"year": filters.year}
+
+    label_expr = "p.category" if dim0 == "category" else "p.name"
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label=label_expr, where="WHERE s.year = :year", order="DESC", limit="")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_sales_growth_analysis(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    where_sql, params, join_products = _where(filters, _filter_mask(filters, _W_YEAR_RANGE | _W_CATEGORY))
+
+    join_sql = _JOIN_PRODUCTS if join_products else ""
+
+    sql = _sql(_YEARLY_GROWTH_SQL, join=join_sql, where=where_sql)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_multi_year_comparison(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    year_count = filters.year_count
+    if year_count is None or year_count <= 0 or year_count > 20:
+        year_count = 3
+
+    if filters.category is not None:
+        join_sql = _JOIN_PRODUCTS
+        extra_where = "AND lower(p.category) = lower(:category)"
+        params: dict[str, Any] = {"year_count": year_count, "category": filters.category}
+    else:
+        join_sql = ""
         extra_where = ""
-        if isinstance(category, str) and category.strip():
-            join_products = True
-            extra_where = "AND lower(p.category) = lower(:category)"
-            params["category"] = category.strip()
-
-        join_sql = "JOIN products p ON p.id = s.product_id" if join_products else ""
-
-        if bool(average):
-            sql = f"""
-                WITH max_year AS (SELECT MAX(year) AS y FROM sales),
-                     yearly AS (
-                       SELECT s.year,
-                              SUM(s.revenue)::NUMERIC AS revenue
-                       FROM sales s
-                       {join_sql}
-                       WHERE s.year >= (SELECT y FROM max_year) - :year_count + 1
-                       {extra_where}
-                       GROUP BY s.year
-                     )
-                SELECT 'avg'::TEXT AS label,
-                       AVG(revenue)::NUMERIC AS value
-                FROM yearly
-            """
-            return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
-
-        sql = f"""
-            WITH max_year AS (SELECT MAX(year) AS y FROM sales)
-            SELECT s.year::TEXT AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            {join_sql}
-            WHERE s.year >= (SELECT y FROM max_year) - :year_count + 1
-            {extra_where}
-            GROUP BY s.year
-            ORDER BY s.year ASC
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+        params = {"year_count": year_count}
 
-    if intent_name == "clarification_required":
-        # Deterministic, safe fallback: return an empty chart.
-        sql = "SELECT 1::TEXT AS label, 0::NUMERIC AS value WHERE FALSE"
-        return PlannedQuery(sql=sql, params={}, chart_type=chart, label_field="label", value_field="value")
-
-    if intent_name == "revenue_by_category":
-        year = filters.get("year")
-        where_sql = ""
-        params = {}
-        if isinstance(year, int):
-            where_sql = "WHERE s.year = :year"
-            params["year"] = year
-
-        sql = f"""
-            SELECT p.category AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY p.category
-            ORDER BY value DESC
-        """
+    if filters.average:
+        sql = _sql(_AVERAGE_YEARLY_SQL, join=join_sql, extra_where=extra_where)
         return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
 
-    if intent_name == "top_products":
-        year = filters.get("year")
-        limit = filters.get("limit")
-        if not isinstance(limit, int) or limit <= 0 or limit > 50:
-            limit = 10
-
-        where_sql = ""
-        params = {"limit": limit}
-        if isinstance(year, int):
-            where_sql = "WHERE s.year = :year"
-            params["year"] = year
-
-        sql = f"""
-            SELECT p.name AS label,
-                   SUM(s.revenue)::NUMERIC AS value
-            FROM sales s
-            JOIN products p ON p.id = s.product_id
-            {where_sql}
-            GROUP BY p.name
-            ORDER BY value DESC
-            LIMIT :limit
-        """
-        return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+    sql = _sql(_RECENT_YEARS_SQL, join=join_sql, extra_where=extra_where)
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_revenue_by_category(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR))
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label="p.category", where=where_sql, order="DESC", limit="")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+def _plan_top_products(filters: NormalizedFilters, chart: ChartType, dim0: DimensionName) -> PlannedQuery:
+    limit = filters.limit
+    if limit is None or limit <= 0 or limit > 50:
+        limit = 10
+
+    where_sql, params, _ = _where(filters, _filter_mask(filters, _W_YEAR), limit=limit)
+
+    sql = _sql(_GROUPED_TOTALS_SQL, label="p.name", where=where_sql, order="DESC", limit="LIMIT :limit")
+    return PlannedQuery(sql=sql, params=params, chart_type=chart, label_field="label", value_field="value")
+
+
+# One planner function per intent; intents whose SQL is identical share a handler.
+_HANDLERS: dict[str, Callable[[NormalizedFilters, ChartType, DimensionName], PlannedQuery]] = {
+    "sales_trend": _plan_sales_trend,
+    "sales_comparison": _plan_sales_trend,
+    "sales_trend_over_time": _plan_sales_trend,
+    "sales_comparison_by_year": _plan_sales_comparison_by_year,
+    "total_sales_for_period": _plan_total_sales_for_period,
+    "sales_by_product": _plan_sales_by_product,
+    "product_sales_trend": _plan_product_sales_trend,
+    "sales_by_category": _plan_sales_by_category,
+    "top_bottom_performers": _plan_top_bottom_performers,
+    "sales_breakdown_for_year": _plan_sales_breakdown_for_year,
+    "sales_growth_analysis": _plan_sales_growth_analysis,
+    "multi_year_comparison": _plan_multi_year_comparison,
+    "revenue_by_category": _plan_revenue_by_category,
+    "top_products": _plan_top_products,
+}
+
+
+# Only these payload keys influence planning, so anything else (e.g. the raw question) stays out of the cache key.
+_PLAN_KEYS = ("intent", "metrics", "dimensions", "filters", "chart")
+_PLAN_CACHE_SIZE = 512
+
+
+class _Unhashable(Exception):
+    pass
+
+
+# Type-tagged so 1, 1.0 and True stay distinct keys and thaw back to the same values. List order is
+# kept as-is (dimensions[0] picks the grouping), dict items are sorted so key order doesn't matter.
+def _freeze(value: Any) -> tuple:
+    if type(value) is dict:
+        try:
+            items = sorted(value.items())
+        except TypeError:
+            raise _Unhashable from None
+        return ("d", tuple((k, _freeze(v)) for k, v in items))
+    if type(value) is list:
+        return ("l", tuple(_freeze(v) for v in value))
+    if value is None or type(value) in (str, int, float, bool):
+        return ("v", type(value), value)
+    raise _Unhashable
+
+
+def _thaw(frozen: tuple) -> Any:
+    tag, value = frozen[0], frozen[-1]
+    if tag == "d":
+        return {k: _thaw(v) for k, v in value}
+    if tag == "l":
+        return [_thaw(v) for v in value]
+    return value
+
+
+# Plans handed out are shared (the cache returns the same instance to every caller), so params are
+# sealed in a read-only mapping. List values stay lists (not tuples): drivers such as psycopg 3 bind a
+# tuple as a composite record rather than an array, so callers must simply not mutate them.
+def _read_only(plan: PlannedQuery) -> PlannedQuery:
+    return replace(plan, params=MappingProxyType(dict(plan.params)))
+
+
+@functools.lru_cache(maxsize=_PLAN_CACHE_SIZE)
+def _plan_intent_cached(key: tuple) -> PlannedQuery:
+    return _read_only(_plan_intent(dict(zip(_PLAN_KEYS, (_thaw(part) for part in key)))))
+
+
+# Deterministic, safe fallback for clarification_required: an empty chart. It takes no filters, so
+# there is one prebuilt plan per chart type and planning is skipped entirely.
+_CLARIFICATION_PLANS = {
+    chart: _read_only(
+        PlannedQuery(sql=_sql(_EMPTY_CHART_SQL), params={}, chart_type=chart, label_field="label", value_field="value")
+    )
+    for chart in _CHART_VALUES
+}
+
+
+def _clarification_plan(chart: Any) -> PlannedQuery:
+    plan = _CLARIFICATION_PLANS.get(chart) if type(chart) is str else None
+    return plan or _CLARIFICATION_PLANS[INTENTS["clarification_required"].default_chart]
+
+
+# Intents whose specs differ only in default_chart and that share a handler. Once the chart is
+# resolved they produce identical plans, so they are keyed under one name and share cache entries.
+_SHARED_PLANS = {
+    "sales_trend": "sales_trend",
+    "sales_comparison": "sales_trend",
+    "sales_trend_over_time": "sales_trend",
+}
+
+
+def _canonical_payload(intent_payload: dict[str, Any]) -> dict[str, Any]:
+    intent = intent_payload.get("intent")
+    canonical = _SHARED_PLANS.get(intent) if type(intent) is str else None
+    if canonical is None:
+        return intent_payload
+
+    default_chart = INTENTS[intent].default_chart
+    chart = intent_payload.get("chart") or default_chart
+    if type(chart) is not str or chart not in _CHART_VALUES:
+        chart = default_chart
+    return {**intent_payload, "intent": canonical, "chart": chart}
+
+
+# Dashboards re-issue the same few intents, so plans are memoized on the payload's canonical form.
+def plan_intent(intent_payload: dict[str, Any]) -> PlannedQuery:
+    if type(intent_payload) is not dict:
+        return _plan_intent(intent_payload)
+    if intent_payload.get("intent") == "clarification_required":
+        return _clarification_plan(intent_payload.get("chart"))
+    try:
+        canonical = _canonical_payload(intent_payload)
+        key = tuple(_freeze(canonical.get(k)) for k in _PLAN_KEYS)
+    except _Unhashable:
+        return _read_only(_plan_intent(intent_payload))
+
+    return _plan_intent_cached(key)
+
+
+# Based on payload and payload data, plan an SQL query
+def _plan_intent(intent_payload: dict[str, Any]) -> PlannedQuery:
+    intent = intent_payload.get("intent")
+    spec = INTENTS.get(intent)
+    if spec is None:
+        raise QueryPlannerError(f"Unsupported intent: {intent}")
+
+    metrics = intent_payload.get("metrics") or []
+    dimensions = intent_payload.get("dimensions") or []
+    filters = intent_payload.get("filters") or {}
+
+    if type(metrics) is not list or type(dimensions) is not list or type(filters) is not dict:
+        raise QueryPlannerError("Invalid intent JSON: metrics/dimensions/filters types")
+
+    _validate_list(metrics, spec.allowed_metrics, "metric")
+    _validate_list(dimensions, spec.allowed_dimensions, "dimension")
+
+    chart = intent_payload.get("chart") or spec.default_chart
+    # A chart from the LLM can be any JSON value; an unhashable one would make the set lookup raise.
+    if type(chart) is not str or chart not in _CHART_VALUES:
+        chart = spec.default_chart
+
+    intent_name: IntentName = intent
+    # metric0: MetricName = metrics[0] if metrics else "total_revenue"
+    dim0: DimensionName = dimensions[0] if dimensions else spec.default_dimension
 
-    raise QueryPlannerError(f"No planner mapping for intent: {intent_name}")
+    handler = _HANDLERS.get(intent_name)
+    if handler is None:
+        raise QueryPlannerError(f"No planner mapping for intent: {intent_name}")
+    return handler(_normalize_filters(filters), chart, dim0)
 
 
-def as_sqlalchemy_text(plan: PlannedQuery):
-    return text(plan.sql)
+def as_sqlalchemy_text(plan: PlannedQuery) -> TextClause:
+    return plan.sql if isinstance(plan.sql, TextClause) else text(plan.sql)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Any, Literal
 
+import msgspec
 from pydantic import BaseModel, Field
 
 
@@ -12,18 +13,28 @@ class QueryRequest(BaseModel):
 ChartType = Literal["line", "bar"]
 
 
-class Dataset(BaseModel):
+# /query responses are built server-side and never validated, so they are msgspec Structs encoded
+# straight to JSON instead of going through Pydantic. They hold only strings and float lists and can't
+# form reference cycles, so gc=False keeps them out of the cyclic garbage collector.
+class Dataset(msgspec.Struct, gc=False):
     label: str
     data: list[float]
 
 
-class QueryResponse(BaseModel):
+class QueryResponse(msgspec.Struct, kw_only=True, gc=False):
     title: str | None = None
     chartType: ChartType
     labels: list[str]
     datasets: list[Dataset]
 
 
+# FastAPI can't derive a schema from Structs, so msgspec builds it: QUERY_RESPONSE_SCHEMA is the $ref the
+# /query route documents, and QUERY_RESPONSE_COMPONENTS are merged into the app's OpenAPI components.
+(QUERY_RESPONSE_SCHEMA,), QUERY_RESPONSE_COMPONENTS = msgspec.json.schema_components(
+    [QueryResponse], ref_template="#/components/schemas/{name}"
+)
+
+
 class ErrorResponse(BaseModel):
     error: str
     detail: Any | None = None
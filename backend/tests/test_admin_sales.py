@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.main import app
+from app.settings import settings
+
+
+async def _fetch(sql: str, params: dict) -> list:
+    engine = create_async_engine(settings.database_url, poolclass=NullPool)
+    try:
+        async with engine.begin() as conn:
+            return (await conn.execute(text(sql), params)).all()
+    finally:
+        await engine.dispose()
+
+
+# Runs against DATABASE_URL; skipped when Postgres is not reachable.
+class StoredRevenueTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        try:
+            asyncio.run(_fetch("SELECT 1", {}))
+        except Exception as e:
+            raise unittest.SkipTest(f"Postgres not reachable: {e}")
+
+    def setUp(self):
+        self.client = TestClient(app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        product = self.client.post("/admin/products", json={"name": "Test Product", "category": "Test"}).json()
+        # Deleting the product cascades to its sales.
+        self.addCleanup(self.client.delete, f"/admin/products/{product['id']}")
+        self.product_id = product["id"]
+
+    def _stored_revenue(self, sale_id: int) -> str:
+        rows = asyncio.run(_fetch("SELECT revenue::TEXT FROM sales WHERE id = :id", {"id": sale_id}))
+        return rows[0][0]
+
+    def test_create_sale_stores_decimal_revenue(self):
+        r = self.client.post("/admin/sales", json={"product_id": self.product_id, "year": 2024, "revenue": 0.1})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self._stored_revenue(r.json()["id"]), "0.1")
+
+    def test_update_sale_stores_decimal_revenue(self):
+        sale = self.client.post("/admin/sales", json={"product_id": self.product_id, "year": 2024, "revenue": 1}).json()
+        r = self.client.patch(f"/admin/sales/{sale['id']}", json={"revenue": 1234.56})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self._stored_revenue(sale["id"]), "1234.56")
+
+    def test_batch_sales_store_decimal_revenue(self):
+        rows = [{"product_id": self.product_id, "year": 2024, "revenue": v} for v in (0.1, 0.2, 19.99)]
+        r = self.client.post("/admin/sales:batch", json=rows)
+        self.assertEqual(r.status_code, 200)
+        stored = [self._stored_revenue(item["id"]) for item in r.json()["items"]]
+        self.assertEqual(stored, ["0.1", "0.2", "19.99"])
+
+
+if __name__ == "__main__":
+    unittest.main()
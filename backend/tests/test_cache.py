@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+from app import cache
+
+
+# Stands in for the Redis client; only the generation counter goes through it.
+class _FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+
+class CacheInvalidationTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # InMemoryBackend's store is shared by all instances, so each test gets its own prefix.
+        FastAPICache.init(InMemoryBackend(), prefix=self.id(), expire=60)
+        self._saved_redis = cache._redis
+        cache._redis = _FakeRedis()
+        self.addCleanup(setattr, cache, "_redis", self._saved_redis)
+        self.addCleanup(FastAPICache.reset)
+
+    async def test_hit_after_set(self):
+        cached, generation = await cache.cache_get(cache.PRODUCTS_NAMESPACE, "list")
+        self.assertIsNone(cached)
+        await cache.cache_set(cache.PRODUCTS_NAMESPACE, "list", {"items": [1]}, generation)
+        cached, _ = await cache.cache_get(cache.PRODUCTS_NAMESPACE, "list")
+        self.assertEqual(cached, {"items": [1]})
+
+    async def test_invalidate_drops_cached_value(self):
+        _, generation = await cache.cache_get(cache.SALES_NAMESPACE, "list")
+        await cache.cache_set(cache.SALES_NAMESPACE, "list", {"items": [1]}, generation)
+        await cache.invalidate(cache.SALES_NAMESPACE)
+        cached, _ = await cache.cache_get(cache.SALES_NAMESPACE, "list")
+        self.assertIsNone(cached)
+
+    # A list read misses and queries the DB; meanwhile a write commits and invalidates; then the read
+    # stores what it fetched. That pre-write result must not be served afterwards.
+    async def test_write_during_read_does_not_leave_stale_list(self):
+        db_read = asyncio.Event()
+        written = asyncio.Event()
+
+        async def read_list():
+            cached, generation = await cache.cache_get(cache.PRODUCTS_NAMESPACE, "list")
+            self.assertIsNone(cached)
+            stale = {"items": ["before write"]}
+            db_read.set()
+            await written.wait()
+            await cache.cache_set(cache.PRODUCTS_NAMESPACE, "list", stale, generation)
+
+        async def write():
+            await db_read.wait()
+            await cache.invalidate(cache.PRODUCTS_NAMESPACE)
+            written.set()
+
+        await asyncio.gather(read_list(), write())
+        cached, _ = await cache.cache_get(cache.PRODUCTS_NAMESPACE, "list")
+        self.assertIsNone(cached)
+
+    async def test_disabled_without_redis(self):
+        cache._redis = None
+        self.assertEqual(await cache.cache_get(cache.PRODUCTS_NAMESPACE, "list"), (None, None))
+        await cache.cache_set(cache.PRODUCTS_NAMESPACE, "list", {"items": []}, 0)
+        await cache.invalidate(cache.PRODUCTS_NAMESPACE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,4 +23,7 @@ CREATE TABLE IF NOT EXISTS sales (
 );
 
 CREATE INDEX IF NOT EXISTS idx_sales_year ON sales(year);
+CREATE INDEX IF NOT EXISTS idx_sales_product_id ON sales(product_id);
+-- Matches the admin sales listing order, so pages are an index range scan instead of a full sort.
+CREATE INDEX IF NOT EXISTS idx_sales_year_id_desc ON sales(year DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_products_category ON products(category);
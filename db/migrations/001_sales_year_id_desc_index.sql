@@ -0,0 +1,4 @@
+-- Adds the admin sales listing index to databases created before it was part of db/init/01_schema.sql.
+-- Idempotent. CONCURRENTLY avoids blocking writes to sales, so psql must run it outside a transaction
+-- (the default; don't use --single-transaction).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sales_year_id_desc ON sales(year DESC, id DESC);